@@ -1,141 +1,87 @@
 import os
-import fitz  # PyMuPDF
-import pdfplumber
-import io
-from PIL import Image
 import google.generativeai as genai
 from dotenv import load_dotenv
-import json
+import orjson
+import pandas as pd
+import re
+import time
+from google.api_core import exceptions as google_exceptions
 import streamlit as st
+from extraction import TEXT_PROMPT, IMAGE_PROMPT, get_payload_key, get_text_with_pdfplumber, prepare_image
 
 # --- Configuration ---
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def init_genai():
+    # Runs once per process instead of on every Streamlit rerun
+    load_dotenv()
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    return True
 
 # Load API key from environment variables
 try:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    init_genai()
 except KeyError:
     st.error("FATAL: GOOGLE_API_KEY environment variable not set. Please set it to your Gemini API key.")
     st.stop()
 
-# --- Prompts ---
-TEXT_PROMPT = """
-You are an expert accounts payable specialist. Your task is to analyze the following text content from an invoice and a purchase order and extract key information.
-
-From the INVOICE text, extract:
-- Invoice Number
-- Date
-- Vendor Name
-- A list of all line items. Each item should have a 'description', 'quantity', and 'price'.
-- Total Amount
-
-From the PURCHASE ORDER text, extract:
-- PO Number
-- Date
-- Vendor Name
-- A list of all ordered items. Each item should have a 'description', 'quantity', and 'price'.
-- Total Amount
-
-Return your findings ONLY as a single, minified JSON object. The JSON structure must be:
-{
-  "invoice_data": {
-    "invoice_no": "...", "date": "...", "vendor": "...",
-    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
-    "total": 0.00
-  },
-  "po_data": {
-    "po_no": "...", "date": "...", "vendor": "...",
-    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
-    "total": 0.00
-  }
-}
-"""
+# Markdown code fences Gemini sometimes wraps around its JSON reply
+JSON_FENCE_PATTERN = re.compile(r'^```(?:json)?\n?|\n?```$', re.M)
 
-IMAGE_PROMPT = """
-You are an expert accounts payable specialist. Your task is to extract key information from the provided document images.
+GENERATION_CONFIG = genai.types.GenerationConfig(temperature=0)
 
-From the INVOICE image, extract:
-- Invoice Number
-- Date
-- Vendor Name
-- A list of all line items. Each item should have a 'description', 'quantity', and 'price'.
-- Total Amount
-
-From the PURCHASE ORDER image, extract:
-- PO Number
-- Date
-- Vendor Name
-- A list of all ordered items. Each item should have a 'description', 'quantity', and 'price'.
-- Total Amount
-
-Return your findings ONLY as a single, minified JSON object. The JSON structure must be:
-{
-  "invoice_data": {
-    "invoice_no": "...", "date": "...", "vendor": "...",
-    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
-    "total": 0.00
-  },
-  "po_data": {
-    "po_no": "...", "date": "...", "vendor": "...",
-    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
-    "total": 0.00
-  }
-}
-"""
+# Rate limits, 5xx and network blips are worth retrying; bad JSON is not
+GEMINI_MAX_ATTEMPTS = 3
+TRANSIENT_GEMINI_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    TimeoutError,
+    ConnectionError,
+)
 
 # --- Gemini API Interaction ---
-def get_gemini_response(payload):
-    model = genai.GenerativeModel('models/gemini-pro-latest')
+def get_cached_gemini_response(prompt, payload):
+    # Repeat clicks on the same invoice/PO pair skip the Gemini call entirely
+    cache = st.session_state.setdefault("gemini_cache", {})
+    key = get_payload_key(prompt, payload)
+    if key not in cache:
+        cache[key] = get_gemini_response(prompt, payload)
+    return cache[key]
+
+@st.cache_resource(show_spinner=False)
+def get_model(prompt):
+    # The static prompt is sent as the system instruction, separate from the
+    # per-document content; one model instance per prompt is reused across reruns.
+    return genai.GenerativeModel('models/gemini-pro-latest', system_instruction=prompt)
+
+def get_gemini_response(prompt, payload):
+    response = None
     try:
-        generation_config = genai.types.GenerationConfig(temperature=0)
-        response = model.generate_content(payload, generation_config=generation_config)
-        json_text = response.text.strip().replace('```json', '').replace('```', '')
-        return json.loads(json_text)
+        for attempt in range(GEMINI_MAX_ATTEMPTS):
+            try:
+                response = get_model(prompt).generate_content(payload, generation_config=GENERATION_CONFIG)
+                break
+            except TRANSIENT_GEMINI_ERRORS as e:
+                if attempt == GEMINI_MAX_ATTEMPTS - 1:
+                    raise
+                print(f"Gemini call failed ({e}), retrying in {2 ** attempt}s")
+                time.sleep(2 ** attempt)
+        json_text = JSON_FENCE_PATTERN.sub('', response.text.strip()).strip()
+        return orjson.loads(json_text)
     except Exception as e:
         st.error("An error occurred with the Gemini API or its response.")
-        st.write("Raw Gemini response:", response.text if 'response' in locals() else "No response object")
-        st.stop()
-
-# --- Helpers ---
-def get_text_with_pdfplumber(file_path):
-    try:
-        with pdfplumber.open(file_path) as pdf:
-            text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-        return text.strip()
-    except Exception as e:
-        print(f"pdfplumber failed: {e}")
-        return ""
-
-def prepare_image(file_path):
-    if not file_path.lower().endswith('.pdf'):
-        return Image.open(file_path)
-    try:
-        doc = fitz.open(file_path)
-        page = doc.load_page(0)
-        pix = page.get_pixmap(dpi=300)
-        img_data = pix.tobytes("png")
-        doc.close()
-        return Image.open(io.BytesIO(img_data))
-    except Exception as e:
-        st.error(f"Failed to convert PDF to image: {e}")
+        st.write("Raw Gemini response:", response.text if response is not None else "No response object")
         st.stop()
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Invoice & PO Matching Tool", layout="wide")
 
-# Custom CSS with Tailwind CDN
+# Custom CSS with Tailwind CDN; the stylesheets are static assets (see .streamlit/config.toml)
+# so each rerun only re-sends two link tags instead of the whole style block
 st.markdown("""
 <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
-<style>
-    .card { background-color: #ffffff; border-radius: 8px; box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1); padding: 20px; margin-bottom: 20px; }
-    .header { background-color: #1f2937; color: white; padding: 20px; border-radius: 8px 8px 0 0; }
-    .sidebar-card { background-color: #f9fafb; border-radius: 8px; padding: 20px; margin-bottom: 20px; }
-    .btn-primary { background-color: #2563eb; color: white; padding: 10px 20px; border-radius: 6px; }
-    .btn-primary:hover { background-color: #1d4ed8; }
-    .table-header { background-color: #ffffff; color: #000000; font-weight: 600; }
-    .status-approved { color: #15803d; font-weight: bold; }
-    .status-review { color: #b91c1c; font-weight: bold; }
-</style>
+<link href="app/static/style.css" rel="stylesheet">
 """, unsafe_allow_html=True)
 
 # Header
@@ -159,27 +105,27 @@ with st.sidebar:
             st.error("Please upload both an Invoice and a Purchase Order file.")
             st.stop()
 
-        # Save temp files
-        invoice_path = f"temp_invoice_{invoice_file.name}"
-        po_path = f"temp_po_{po_file.name}"
-        with open(invoice_path, "wb") as f:
-            f.write(invoice_file.read())
-        with open(po_path, "wb") as f:
-            f.write(po_file.read())
+        # Work on the in-memory upload buffers; no temp files needed
+        invoice_bytes = invoice_file.getvalue()
+        po_bytes = po_file.getvalue()
 
-        invoice_text = get_text_with_pdfplumber(invoice_path)
-        po_text = get_text_with_pdfplumber(po_path)
+        invoice_text = get_text_with_pdfplumber(invoice_bytes)
+        po_text = get_text_with_pdfplumber(po_bytes)
 
         if invoice_text and po_text:
             st.info("✅ Using text-based extraction.")
-            payload = [TEXT_PROMPT, f"\n--- INVOICE TEXT ---\n{invoice_text}", f"\n--- PO TEXT ---\n{po_text}"]
-            analysis = get_gemini_response(payload)
+            payload = [f"--- INVOICE TEXT ---\n{invoice_text}", f"\n--- PO TEXT ---\n{po_text}"]
+            analysis = get_cached_gemini_response(TEXT_PROMPT, payload)
         else:
             st.warning("⚠️ Text extraction failed. Falling back to image-based analysis.")
-            invoice_image = prepare_image(invoice_path)
-            po_image = prepare_image(po_path)
-            payload = [IMAGE_PROMPT, invoice_image, po_image]
-            analysis = get_gemini_response(payload)
+            try:
+                invoice_image = prepare_image(invoice_bytes, invoice_file.name)
+                po_image = prepare_image(po_bytes, po_file.name)
+            except Exception as e:
+                st.error(f"Failed to prepare document image: {e}")
+                st.stop()
+            payload = [invoice_image, po_image]
+            analysis = get_cached_gemini_response(IMAGE_PROMPT, payload)
 
         invoice_data = analysis.get('invoice_data', {})
         po_data = analysis.get('po_data', {})
@@ -190,27 +136,26 @@ if 'analysis' in locals():
     col1, col2 = st.columns(2)
 
     def display_doc(title, data, doc_type):
-        st.markdown(f'<div class="card">', unsafe_allow_html=True)
-        st.markdown(f'<h2 class="text-xl font-semibold">{title}</h2>', unsafe_allow_html=True)
-        st.markdown(f'<p><strong>{doc_type.capitalize()} #:</strong> {data.get(f"{doc_type.lower()}_no", "N/A")}</p>', unsafe_allow_html=True)
-        st.markdown(f'<p><strong>Date:</strong> {data.get("date", "N/A")}</p>', unsafe_allow_html=True)
-        st.markdown(f'<p><strong>Vendor:</strong> {data.get("vendor", "N/A")}</p>', unsafe_allow_html=True)
-        st.markdown('<h3 class="text-lg font-medium mt-4">Items</h3>', unsafe_allow_html=True)
-        items = data.get("items", [])
-        if items:
-            # Custom table styling
-            table_html = '<table class="w-full border-collapse"><thead><tr class="table-header">'
-            table_html += '<th class="p-2 text-left">Description</th><th class="p-2 text-left">Quantity</th><th class="p-2 text-left">Price</th></tr></thead><tbody>'
-            for item in items:
-                table_html += f'<tr><td class="p-2 border-t">{item.get("description", "N/A")}</td>'
-                table_html += f'<td class="p-2 border-t">{item.get("quantity", "N/A")}</td>'
-                table_html += f'<td class="p-2 border-t">${float(item.get("price", 0.0)):.2f}</td></tr>'
-            table_html += '</tbody></table>'
-            st.markdown(table_html, unsafe_allow_html=True)
-        else:
-            st.markdown('<p class="text-gray-500">No items found.</p>', unsafe_allow_html=True)
-        st.markdown(f'<h3 class="text-lg font-medium mt-4">Total: ${float(data.get("total", 0.0)):.2f}</h3>', unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        # HTML for the details, st.dataframe for the (possibly long) item table
+        with st.container(border=True):
+            parts = [
+                f'<h2 class="text-xl font-semibold">{title}</h2>',
+                f'<p><strong>{doc_type.capitalize()} #:</strong> {data.get(f"{doc_type.lower()}_no", "N/A")}</p>',
+                f'<p><strong>Date:</strong> {data.get("date", "N/A")}</p>',
+                f'<p><strong>Vendor:</strong> {data.get("vendor", "N/A")}</p>',
+                '<h3 class="text-lg font-medium mt-4">Items</h3>',
+            ]
+            items = data.get("items", [])
+            if not items:
+                parts.append('<p class="text-gray-500">No items found.</p>')
+            st.markdown("".join(parts), unsafe_allow_html=True)
+            if items:
+                # object dtype keeps integer quantities as-is when some are missing
+                df = pd.DataFrame(items, columns=["description", "quantity", "price"], dtype=object)
+                df["price"] = df["price"].fillna(0.0).astype(float).map("${:.2f}".format)
+                df = df.fillna("N/A").rename(columns=str.capitalize)
+                st.dataframe(df, width="stretch", hide_index=True)
+            st.markdown(f'<h3 class="text-lg font-medium mt-4">Total: ${float(data.get("total", 0.0)):.2f}</h3>', unsafe_allow_html=True)
 
     with col1:
         display_doc("📄 Invoice Details", invoice_data, "invoice")
@@ -221,6 +166,14 @@ if 'analysis' in locals():
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown('<h2 class="text-xl font-semibold">🔎 Match/Mismatch Summary</h2>', unsafe_allow_html=True)
 
+    def item_matches(i_item, p_item):
+        # Prices and quantities are already JSON numbers, so compare them directly
+        return (
+            i_item.get("description") == p_item.get("description") and
+            i_item.get("price",0) == p_item.get("price",0) and
+            i_item.get("quantity",0) == p_item.get("quantity",0)
+        )
+
     def generate_match_summary(invoice_data, po_data):
         lines = []
         issues = []
@@ -251,18 +204,10 @@ if 'analysis' in locals():
         invoice_items = invoice_data.get("items", [])
         po_items = po_data.get("items", [])
 
-        all_items_match = True
-        if len(invoice_items) != len(po_items):
-            all_items_match = False
-        else:
-            for i_item, p_item in zip(invoice_items, po_items):
-                if (
-                    i_item.get("description") != p_item.get("description") or
-                    float(i_item.get("price",0)) != float(p_item.get("price",0)) or
-                    int(i_item.get("quantity",0)) != int(p_item.get("quantity",0))
-                ):
-                    all_items_match = False
-                    break
+        # Length check first, then all() stops at the first differing pair
+        all_items_match = len(invoice_items) == len(po_items) and all(
+            item_matches(i_item, p_item) for i_item, p_item in zip(invoice_items, po_items)
+        )
 
         if all_items_match:
             lines.append("• All items match ✓")
@@ -0,0 +1,78 @@
+import argparse
+import base64
+import glob
+import os
+import orjson
+from extraction import TEXT_PROMPT, IMAGE_PROMPT, get_text_with_pdfplumber, prepare_image
+
+# Bulk (non-interactive) runs: build a Gemini Batch API input file from a
+# directory of invoice/PO pairs. Each subdirectory of the input directory is
+# one pair and holds an "invoice.*" and a "po.*" file; its name is the
+# request key in the batch output. See README.md for how to submit the file.
+
+def build_payload(invoice_bytes, invoice_name, po_bytes, po_name):
+    # Same text-first, image-fallback strategy as the Streamlit app
+    invoice_text = get_text_with_pdfplumber(invoice_bytes)
+    po_text = get_text_with_pdfplumber(po_bytes)
+    if invoice_text and po_text:
+        return TEXT_PROMPT, [f"--- INVOICE TEXT ---\n{invoice_text}", f"\n--- PO TEXT ---\n{po_text}"]
+    return IMAGE_PROMPT, [prepare_image(invoice_bytes, invoice_name), prepare_image(po_bytes, po_name)]
+
+def build_batch_request(key, prompt, payload):
+    # One line of a Gemini Batch API JSONL input file
+    parts = []
+    for part in payload:
+        if isinstance(part, dict):
+            parts.append({"inline_data": {"mime_type": part["mime_type"], "data": base64.b64encode(part["data"]).decode("ascii")}})
+        else:
+            parts.append({"text": part})
+    return {
+        "key": key,
+        "request": {
+            "system_instruction": {"parts": [{"text": prompt}]},
+            "contents": [{"role": "user", "parts": parts}],
+            "generation_config": {"temperature": 0},
+        },
+    }
+
+def find_document(pair_dir, stem):
+    matches = glob.glob(os.path.join(glob.escape(pair_dir), f"{stem}.*"))
+    if len(matches) != 1:
+        raise ValueError(f"Expected exactly one {stem}.* file in {pair_dir}, found {len(matches)}")
+    return matches[0]
+
+def read_document(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Gemini Batch API input file from invoice/PO pairs.")
+    parser.add_argument("input_dir", help="Directory with one subdirectory per invoice/PO pair")
+    parser.add_argument("-o", "--output", default="batch_requests.jsonl", help="JSONL file to write")
+    args = parser.parse_args()
+
+    pair_dirs = sorted(
+        entry.path for entry in os.scandir(args.input_dir) if entry.is_dir()
+    )
+    # A bad pair is reported and skipped so one corrupt file doesn't stop the run
+    written, skipped = 0, 0
+    with open(args.output, "wb") as f:
+        for pair_dir in pair_dirs:
+            try:
+                invoice_path = find_document(pair_dir, "invoice")
+                po_path = find_document(pair_dir, "po")
+                prompt, payload = build_payload(
+                    read_document(invoice_path), os.path.basename(invoice_path),
+                    read_document(po_path), os.path.basename(po_path),
+                )
+            except Exception as e:
+                print(f"Skipping {pair_dir}: {e}")
+                skipped += 1
+                continue
+            request = build_batch_request(os.path.basename(pair_dir), prompt, payload)
+            f.write(orjson.dumps(request) + b"\n")
+            written += 1
+    print(f"Wrote {written} requests to {args.output}, skipped {skipped}")
+
+if __name__ == "__main__":
+    main()
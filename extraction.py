@@ -0,0 +1,132 @@
+import io
+import hashlib
+import mimetypes
+import fitz  # PyMuPDF
+import pdfplumber
+
+# Document parsing and prompts shared by the Streamlit app and the batch runner
+
+# --- Prompts ---
+TEXT_PROMPT = """
+You are an expert accounts payable specialist. Your task is to analyze the following text content from an invoice and a purchase order and extract key information.
+
+From the INVOICE text, extract:
+- Invoice Number
+- Date
+- Vendor Name
+- A list of all line items. Each item should have a 'description', 'quantity', and 'price'.
+- Total Amount
+
+From the PURCHASE ORDER text, extract:
+- PO Number
+- Date
+- Vendor Name
+- A list of all ordered items. Each item should have a 'description', 'quantity', and 'price'.
+- Total Amount
+
+Return your findings ONLY as a single, minified JSON object. The JSON structure must be:
+{
+  "invoice_data": {
+    "invoice_no": "...", "date": "...", "vendor": "...",
+    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
+    "total": 0.00
+  },
+  "po_data": {
+    "po_no": "...", "date": "...", "vendor": "...",
+    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
+    "total": 0.00
+  }
+}
+"""
+
+IMAGE_PROMPT = """
+You are an expert accounts payable specialist. Your task is to extract key information from the provided document images.
+
+From the INVOICE image, extract:
+- Invoice Number
+- Date
+- Vendor Name
+- A list of all line items. Each item should have a 'description', 'quantity', and 'price'.
+- Total Amount
+
+From the PURCHASE ORDER image, extract:
+- PO Number
+- Date
+- Vendor Name
+- A list of all ordered items. Each item should have a 'description', 'quantity', and 'price'.
+- Total Amount
+
+Return your findings ONLY as a single, minified JSON object. The JSON structure must be:
+{
+  "invoice_data": {
+    "invoice_no": "...", "date": "...", "vendor": "...",
+    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
+    "total": 0.00
+  },
+  "po_data": {
+    "po_no": "...", "date": "...", "vendor": "...",
+    "items": [{"description": "...", "quantity": 1, "price": 0.00}],
+    "total": 0.00
+  }
+}
+"""
+
+# --- Helpers ---
+def get_payload_key(prompt, payload):
+    # Hash the prompt/text parts directly and image blobs by their raw bytes
+    digest = hashlib.sha256()
+    for part in [prompt, *payload]:
+        if isinstance(part, dict):
+            digest.update(part["data"])
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def is_pdf(data):
+    # Dispatch on the file signature rather than the (possibly wrong) extension;
+    # like PDF readers, allow junk before the header within the first 1 KB
+    return b"%PDF" in data[:1024]
+
+def get_text_with_pdfplumber(data):
+    if not is_pdf(data):
+        return ""
+    # PyMuPDF is much faster than pdfplumber; keep pdfplumber only as a fallback
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            text = "\n".join(page.get_text("text") for page in doc)
+        return text.strip()
+    except Exception as e:
+        print(f"PyMuPDF text extraction failed: {e}")
+    try:
+        parts = []
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            for page in pdf.pages:
+                t = page.extract_text()
+                if t:
+                    parts.append(t)
+        return "\n".join(parts).strip()
+    except Exception as e:
+        print(f"pdfplumber failed: {e}")
+        return ""
+
+def get_image_mime_type(data, file_name):
+    # Trust the file signature; the name is only a last resort
+    if data[:4] == b"\x89PNG":
+        return "image/png"
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    mime_type = mimetypes.guess_type(file_name)[0]
+    if mime_type and mime_type.startswith("image/"):
+        return mime_type
+    raise ValueError(f"{file_name} is not a PDF, PNG or JPEG file")
+
+def prepare_image(data, file_name):
+    # Gemini accepts raw image blobs, so skip the PIL decode/re-encode round-trip
+    if not is_pdf(data):
+        return {"mime_type": get_image_mime_type(data, file_name), "data": data}
+    # Errors are raised, not shown, so the caller decides how to report them
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        pix = doc.load_page(0).get_pixmap(dpi=200)
+        img_data = pix.tobytes("jpeg", jpg_quality=85)
+    return {"mime_type": "image/jpeg", "data": img_data}